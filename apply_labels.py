@@ -24,15 +24,30 @@ from __future__ import annotations
 
 import argparse
 import csv
-import logging
 import os
+import pickle
+import queue
 import shutil
 import sys
-import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from itertools import islice
 from pathlib import Path
+from types import SimpleNamespace
 
 import pydicom
+from pydicom.dataelem import DataElement_from_raw, RawDataElement
+from pydicom.filereader import (
+    _read_file_meta_info,
+    data_element_generator,
+    read_preamble,
+)
 
 # optional progress bar
 try:
@@ -42,22 +57,142 @@ except ImportError:  # pragma: no cover
 
 MANIFEST = Path("series_info.tsv")
 PROTO_MAX_LEN = 64
+CACHE_NAME = ".apply_labels.cache"
+
+# Common spellings checked with str.endswith (a C-level scan, no slice or
+# lower() allocation); unusual casings fall through to the slow check.
+_FAST_SUFFIXES = (".dcm", ".DCM", ".ima", ".IMA")
+
+# Tags needed to decide what to do with a file; scanning only up to these
+# keeps the header parse to ~1 KB instead of the whole dataset.
+UID_TAGS = {0x0020000E: "SeriesInstanceUID"}
+DECISION_TAGS = {
+    0x00180050: "SliceThickness",
+    0x00180088: "SpacingBetweenSlices",
+    0x00181030: "ProtocolName",
+    0x0020000E: "SeriesInstanceUID",
+    0x00200105: "NumberOfTemporalPositions",
+}
+
+# Every slice of a series yields the same classify/format answer, so the
+# decision is computed once from the first slice seen and memoized:
+# uid -> ("unchanged" | "edited", new_proto, proto_bytes).  proto_bytes is
+# the ASCII-encoded, even-padded LO value so the in-place write path skips
+# pydicom's encoder per file.  Slices whose series is already decided skip
+# the classification read entirely.
+_series_decision: dict[str, tuple[str, str, bytes]] = {}
+_series_decision_lock = threading.Lock()
 
 # --------------------------------------------------------------------------- #
 # Helper functions                                                            #
 # --------------------------------------------------------------------------- #
 
-def configure_logger(logfile: Path | None) -> logging.Logger | None:
+# Workers never touch the logfile directly: in thread mode they push
+# preformatted lines onto a SimpleQueue drained by one writer thread (no
+# handler mutex on the hot path); in process mode each worker appends to
+# the file opened by the pool initializer.
+_log_q: queue.SimpleQueue | None = None
+_log_fh = None
+
+
+def log_line(level: str, *fields: object) -> None:
+    if _log_q is None and _log_fh is None:
+        return
+    line = "%s\t%s\t%s\n" % (
+        time.strftime("%Y-%m-%d %H:%M:%S"),
+        level,
+        "\t".join(str(f) for f in fields),
+    )
+    if _log_q is not None:
+        _log_q.put(line)
+    else:
+        _log_fh.write(line)
+
+
+def _init_worker_logfile(logfile: Path | None) -> None:
+    """Process-pool initializer: open the shared logfile in append mode."""
+    global _log_fh
     if logfile is None:
-        return None
+        return
     logfile.parent.mkdir(parents=True, exist_ok=True)
-    logging.basicConfig(
-        filename=logfile,
-        level=logging.INFO,
-        format="%(asctime)s\t%(levelname)s\t%(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    return logging.getLogger("apply_labels")
+    _log_fh = open(logfile, "a", buffering=1)
+
+
+# Shared per-run context, shipped to each worker process once by the pool
+# initializer so a task pickles only its (path, rel) pair — submitting the
+# manifest map and mtime cache with every file would serialize them
+# millions of times over a large archive.
+_worker_ctx: tuple | None = None
+
+
+def _init_worker(
+    logfile: Path | None,
+    uid_map: dict,
+    trash_root: Path,
+    dry_run: bool,
+    cache: dict,
+    same_dev: bool,
+) -> None:
+    global _worker_ctx
+    _init_worker_logfile(logfile)
+    _worker_ctx = (uid_map, trash_root, dry_run, cache, same_dev)
+
+
+def _handle_file_in_worker(path: Path, rel: str) -> str:
+    uid_map, trash_root, dry_run, cache, same_dev = _worker_ctx
+    return handle_file(path, rel, uid_map, trash_root, dry_run, cache,
+                       same_dev)
+
+
+def _drain_log(q: queue.SimpleQueue, logfile: Path) -> None:
+    logfile.parent.mkdir(parents=True, exist_ok=True)
+    with open(logfile, "a", buffering=1 << 20) as f:
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            f.write(item)
+
+
+def quick_read_tags(path: Path, wanted: dict[int, str]) -> dict[str, object]:
+    """
+    Scan a DICOM file element-by-element and return {keyword: value} for
+    *wanted* ({tag_int: keyword}).
+
+    Unlike dcmread(specific_tags=...), which still walks every element up
+    to the pixel data, this stops as soon as all wanted tags are collected
+    or the scan passes the highest wanted tag — no Dataset is built at all.
+    """
+    remaining = dict(wanted)
+    stop_after = max(remaining)
+    out: dict[str, object] = {}
+    with open(path, "rb") as fp:
+        read_preamble(fp, False)
+        file_meta = _read_file_meta_info(fp)
+        ts = file_meta.TransferSyntaxUID
+        if ts.is_deflated:
+            # deflated streams can't be scanned in place; let pydicom do it
+            ds = pydicom.dcmread(
+                path, stop_before_pixels=True, specific_tags=list(wanted.values())
+            )
+            return {
+                name: getattr(ds, name) for name in wanted.values() if name in ds
+            }
+        for raw in data_element_generator(
+            fp, ts.is_implicit_VR, ts.is_little_endian
+        ):
+            tag = int(raw.tag)
+            if tag in remaining:
+                name = remaining.pop(tag)
+                if isinstance(raw, RawDataElement):
+                    out[name] = DataElement_from_raw(raw).value
+                else:
+                    out[name] = raw.value
+                if not remaining:
+                    break
+            elif tag > stop_after:
+                break
+    return out
 
 
 def classify_acq_dim(ds) -> str:
@@ -89,72 +224,262 @@ def build_protocol_name(orig: str, annot: str, dim: str, plane: str) -> str:
     return f"{prefix}{(orig or '')[: max(max_orig_len, 0)]}"
 
 
+def _walk_dir(start: str, prefix_len: int):
+    """
+    Yield (path, rel) pairs for candidate DICOMs under *start* via os.scandir.
+
+    DirEntry caches the file/dir distinction from the directory read, so
+    this does one getdents per directory instead of a stat per entry the
+    way Path.rglob + is_file() does, and skips non-DICOM names before any
+    Path object is built for them.  *rel* is the path relative to the scan
+    root as a plain string, sliced from the absolute path the walker
+    already has — no per-file Path.relative_to walk.
+    """
+    stack = [start]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = entry.name
+                    if (
+                        "." not in name
+                        or name.endswith(_FAST_SUFFIXES)
+                        or name[name.rfind(".") + 1 :].lower() in ("dcm", "ima")
+                    ):
+                        yield Path(entry.path), entry.path[prefix_len:]
+
+
+def iter_dicom_files(root: Path, enum_workers: int = 8):
+    """
+    Yield (path, rel) pairs for candidate DICOMs under *root*.
+
+    Each top-level subdirectory (typically one patient) is walked by its
+    own thread so directory reads overlap instead of queueing one at a
+    time — the first files reach the worker pool before the walk of a
+    large tree has finished.  Results stream through a queue; a None
+    sentinel per walker signals its completion.
+    """
+    top = str(root)
+    prefix_len = len(top.rstrip(os.sep)) + 1
+    try:
+        entries = list(os.scandir(top))
+    except OSError:
+        return
+    subdirs = [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+    for entry in entries:
+        if entry.is_file(follow_symlinks=False):
+            name = entry.name
+            if (
+                "." not in name
+                or name.endswith(_FAST_SUFFIXES)
+                or name[name.rfind(".") + 1 :].lower() in ("dcm", "ima")
+            ):
+                yield Path(entry.path), entry.path[prefix_len:]
+    if not subdirs:
+        return
+    if len(subdirs) == 1:
+        yield from _walk_dir(subdirs[0], prefix_len)
+        return
+
+    results: queue.SimpleQueue = queue.SimpleQueue()
+
+    def walk(d: str) -> None:
+        for item in _walk_dir(d, prefix_len):
+            results.put(item)
+        results.put(None)
+
+    with ThreadPoolExecutor(
+        max_workers=min(enum_workers, len(subdirs))
+    ) as enum_pool:
+        for d in subdirs:
+            enum_pool.submit(walk, d)
+        remaining = len(subdirs)
+        while remaining:
+            item = results.get()
+            if item is None:
+                remaining -= 1
+            else:
+                yield item
+
+
+def load_cache(root: Path) -> dict[str, int]:
+    """
+    Load {rel_path: mtime_ns} of files already at their target ProtocolName.
+
+    The cache is only trusted while the manifest is unchanged; edits to
+    series_info.tsv (new annotations, DELETE flags) invalidate it so every
+    file is re-examined against the new labels.
+    """
+    try:
+        with (root / CACHE_NAME).open("rb") as f:
+            payload = pickle.load(f)
+        if payload.get("manifest_mtime_ns") == MANIFEST.stat().st_mtime_ns:
+            return payload.get("files", {})
+    except Exception:
+        pass
+    return {}
+
+
+def save_cache(root: Path, files: dict[str, int]) -> None:
+    payload = {
+        "manifest_mtime_ns": MANIFEST.stat().st_mtime_ns,
+        "files": files,
+    }
+    with (root / CACHE_NAME).open("wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_protocol_inplace(path: Path, proto_bytes: bytes) -> bool:
+    """
+    Overwrite the ProtocolName (0018,1030) value bytes directly in the file.
+
+    Avoids re-serializing the whole dataset (pixel data included) plus a
+    rename for the common relabel case.  *proto_bytes* is the already
+    ASCII-encoded, even-padded value from the series-decision cache.  Only
+    possible when it fits in the space the old value occupies; returns
+    False to request the full save_as fallback otherwise.
+    """
+    try:
+        ds = pydicom.dcmread(
+            path, stop_before_pixels=True, specific_tags=["ProtocolName"]
+        )
+        raw = ds.get_item((0x0018, 0x1030))
+    except Exception:
+        return False
+    if raw is None or getattr(raw, "value_tell", None) is None:
+        return False
+    if len(proto_bytes) > raw.length:
+        return False
+    # Pad to the old length so the element (and everything after it)
+    # keeps its byte layout.
+    new_bytes = proto_bytes.ljust(raw.length, b" ")
+
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.pwrite(fd, new_bytes, raw.value_tell)
+    finally:
+        os.close(fd)
+    return True
+
+
 # --------------------------------------------------------------------------- #
 # Core worker                                                                 #
 # --------------------------------------------------------------------------- #
 
 def handle_file(
     path: Path,
-    rel: Path,
+    rel: str,
     uid_map: dict[str, tuple[str, str]],
     trash_root: Path,
     dry_run: bool = False,
-    logger: logging.Logger | None = None,
+    cache: dict[str, int] | None = None,
+    same_dev: bool = False,
 ) -> str:
     """Process one DICOM file; returns a status key."""
+    # Re-run fast path: an unchanged mtime means the file was already at its
+    # target ProtocolName last run, so skip it with a single stat.
+    if cache:
+        try:
+            if cache.get(rel) == path.stat().st_mtime_ns:
+                return "unchanged"
+        except OSError:
+            pass
+
     try:
-        ds = pydicom.dcmread(path, defer_size=1024)
+        info = quick_read_tags(path, UID_TAGS)
     except Exception as exc:
-        if logger:
-            logger.error("error\t%s\t%s", rel, exc)
+        log_line("ERROR", "error", rel, exc)
         return "error"
 
-    uid = getattr(ds, "SeriesInstanceUID", None)
+    uid = info.get("SeriesInstanceUID")
+    if uid is None:
+        return "skipped"
+    uid = sys.intern(str(uid))
     if uid not in uid_map:
         return "skipped"
 
     annot, plane = uid_map[uid]
     if (annot or "").upper() == "DELETE":
         if dry_run:
-            if logger:
-                logger.info("dry-move\t%s", rel)
+            log_line("INFO", "dry-move", rel)
             return "moved"
         dest = trash_root / rel
         dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(str(path), dest)
-        if logger:
-            logger.info("move\t%s\t->\t%s", rel, dest.relative_to(trash_root))
+        if same_dev:
+            # trash_root is on the same filesystem: a rename is atomic and
+            # avoids shutil.move's stat probing / copy fallback machinery
+            os.replace(path, dest)
+        else:
+            shutil.move(str(path), dest)
+        log_line("INFO", "move", rel, "->", rel)
         return "moved"
 
-    dim = classify_acq_dim(ds)
-    new_proto = build_protocol_name(
-        str(getattr(ds, "ProtocolName", "")),
-        annot or "UNKNOWN",
-        dim,
-        plane or "UNKNOWN",
-    )
-    if new_proto == getattr(ds, "ProtocolName", ""):
+    with _series_decision_lock:
+        decision = _series_decision.get(uid)
+
+    if decision is None:
+        try:
+            header = quick_read_tags(path, DECISION_TAGS)
+        except Exception as exc:
+            log_line("ERROR", "error", rel, exc)
+            return "error"
+        proto_val = header.get("ProtocolName")
+        current_proto = "" if proto_val is None else str(proto_val)
+        dim = classify_acq_dim(SimpleNamespace(**header))
+        new_proto = build_protocol_name(
+            current_proto,
+            annot or "UNKNOWN",
+            dim,
+            plane or "UNKNOWN",
+        )
+        action = "unchanged" if new_proto == current_proto else "edited"
+        proto_bytes = new_proto.encode("ascii", errors="replace")
+        if len(proto_bytes) & 1:
+            proto_bytes += b" "
+        with _series_decision_lock:
+            _series_decision.setdefault(uid, (action, new_proto, proto_bytes))
+    else:
+        action, new_proto, proto_bytes = decision
+
+    if action == "unchanged":
         return "unchanged"
 
     if dry_run:
-        if logger:
-            logger.info("dry-edit\t%s\t%s", rel, new_proto)
+        log_line("INFO", "dry-edit", rel, new_proto)
         return "edited"
 
+    # Fast path: patch the 64-byte LO value in place, skipping the whole-file
+    # re-serialize + rename when the new name fits the old element.
+    if write_protocol_inplace(path, proto_bytes):
+        log_line("INFO", "edit", rel, new_proto)
+        return "edited"
+
+    # Only now pay for a full read: the saved file must keep its PixelData,
+    # so re-open without stop_before_pixels (deferred so pixels stay on disk).
+    try:
+        ds = pydicom.dcmread(path, defer_size=1024)
+    except Exception as exc:
+        log_line("ERROR", "error", rel, exc)
+        return "error"
+
     ds.ProtocolName = new_proto
 
-    # atomic save
-    fh, tmp_name = tempfile.mkstemp(suffix=".dcm", dir=str(path.parent))
-    os.close(fh)
+    # atomic save: write a sibling temp file, then rename over the original
+    tmp = path.with_name(path.name + ".tmp")
     try:
-        ds.save_as(tmp_name, write_like_original=True)
-        os.replace(tmp_name, path)
-    finally:
-        if os.path.exists(tmp_name):
-            os.unlink(tmp_name)
+        ds.save_as(tmp, write_like_original=True)
+        os.replace(tmp, path)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
 
-    if logger:
-        logger.info("edit\t%s\t%s", rel, new_proto)
+    log_line("INFO", "edit", rel, new_proto)
     return "edited"
 
 
@@ -168,8 +493,17 @@ def main() -> None:
     )
     parser.add_argument("root", type=Path, help="DICOM root directory")
     parser.add_argument(
-        "-j", "--threads", type=int, default=os.cpu_count(),
-        help="Parallel threads (default: all CPUs)",
+        "-j", "--threads", type=int,
+        default=min(32, (os.cpu_count() or 4) * 4),
+        help="Parallel workers (default: 4 per CPU, capped at 32 — header "
+             "reads are I/O-bound, so oversubscribing cores helps until the "
+             "disk queue saturates)",
+    )
+    parser.add_argument(
+        "-p", "--processes", action="store_true",
+        help="Use a process pool instead of threads (for CPU-bound full "
+             "parses; threads are usually faster for the header-only reads "
+             "and share the per-series decision cache)",
     )
     parser.add_argument(
         "-n", "--dry-run", action="store_true",
@@ -188,51 +522,127 @@ def main() -> None:
     if not MANIFEST.exists():
         sys.exit("series_info.tsv not found – run extract_dicom_headers.py first")
 
-    logger = configure_logger(args.logfile)
 
-    # load manifest
+    # load manifest: plain csv.reader + column indices (no per-row dict), and
+    # intern the strings so the per-file uid lookups are pointer compares
     uid_map: dict[str, tuple[str, str]] = {}
-    with MANIFEST.open() as f:
-        for row in csv.DictReader(f, delimiter="\t"):
-            uid_map[row["Series Instance UID"]] = (
-                row.get("Annotation", "").strip(),
-                row.get("Plane Orientation", "").strip(),
+    with MANIFEST.open(newline="") as f:
+        rdr = csv.reader(f, delimiter="\t")
+        header = next(rdr, [])
+        i_uid = header.index("Series Instance UID")
+        i_annot = header.index("Annotation") if "Annotation" in header else -1
+        i_plane = (
+            header.index("Plane Orientation") if "Plane Orientation" in header else -1
+        )
+        for row in rdr:
+            if i_uid >= len(row) or not row[i_uid]:
+                continue
+            uid_map[sys.intern(row[i_uid])] = (
+                sys.intern(row[i_annot].strip()) if 0 <= i_annot < len(row) else "",
+                sys.intern(row[i_plane].strip()) if 0 <= i_plane < len(row) else "",
             )
 
     trash_root = root / "WAITING_DELETION"
+    same_dev = False
+    if not args.dry_run:
+        trash_root.mkdir(parents=True, exist_ok=True)
+        same_dev = root.stat().st_dev == trash_root.stat().st_dev
+
+    cache = {} if args.dry_run else load_cache(root)
+    new_cache: dict[str, int] = {}
 
-    # gather files
-    all_files = [
-        p for p in root.rglob("*")
-        if p.is_file() and p.suffix.lower() in {".dcm", ".ima", ""}
-    ]
+    # files are streamed from the walker; no up-front list of the whole tree
+    files = iter_dicom_files(root)
     print(
-        f"Found {len(all_files)} files. Processing with {args.threads} threads"
+        f"Processing {root} with {args.threads} threads"
         f"{' (dry-run)' if args.dry_run else ''}."
     )
 
     counts = {k: 0 for k in ("edited", "moved", "skipped", "unchanged", "error")}
-    progress = tqdm(total=len(all_files), unit="file") if tqdm else None
-
-    with ThreadPoolExecutor(max_workers=max(1, args.threads)) as pool:
-        futures = {
-            pool.submit(
-                handle_file,
-                p,
-                p.relative_to(root),
-                uid_map,
-                trash_root,
-                args.dry_run,
-                logger,
-            ): p
-            for p in all_files
-        }
-        for fut in as_completed(futures):
-            counts[fut.result()] += 1
-            if progress:
-                progress.update(1)
-
-    if progress:
+    progress = tqdm(unit="file", miniters=128, mininterval=0.5) if tqdm else None
+    completed_since_update = 0
+
+    global _log_q
+    log_thread = None
+    if args.logfile and not args.processes:
+        _log_q = queue.SimpleQueue()
+        log_thread = threading.Thread(
+            target=_drain_log, args=(_log_q, args.logfile), daemon=True
+        )
+        log_thread.start()
+
+    if args.processes:
+        # Each worker process appends to the logfile directly; the
+        # per-series decision cache is then per-process rather than shared.
+        pool_factory = lambda: ProcessPoolExecutor(
+            max_workers=max(1, args.threads),
+            initializer=_init_worker,
+            initargs=(args.logfile, uid_map, trash_root, args.dry_run,
+                      cache, same_dev),
+        )
+    else:
+        pool_factory = lambda: ThreadPoolExecutor(max_workers=max(1, args.threads))
+
+    with pool_factory() as pool:
+
+        paths: dict = {}
+
+        if args.processes:
+            # Workers already hold the run context from the initializer.
+            def submit(item: tuple[Path, str]):
+                p, rel = item
+                fut = pool.submit(_handle_file_in_worker, p, rel)
+                paths[fut] = item
+                return fut
+        else:
+            def submit(item: tuple[Path, str]):
+                p, rel = item
+                fut = pool.submit(
+                    handle_file,
+                    p,
+                    rel,
+                    uid_map,
+                    trash_root,
+                    args.dry_run,
+                    cache,
+                    same_dev,
+                )
+                paths[fut] = item
+                return fut
+
+        # Bounded sliding window: keep ~4 tasks per worker in flight so the
+        # walker and the pool overlap without materializing one Future per
+        # file for the whole tree up front.
+        window = max(1, args.threads) * 4
+        pending = {submit(item) for item in islice(files, window)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                status = fut.result()
+                counts[status] += 1
+                p, rel = paths.pop(fut)
+                if status in ("edited", "unchanged") and not args.dry_run:
+                    try:
+                        new_cache[rel] = p.stat().st_mtime_ns
+                    except OSError:
+                        pass
+                # amortize the tqdm lock + redraw over batches of completions
+                completed_since_update += 1
+                if progress is not None and completed_since_update >= 128:
+                    progress.update(completed_since_update)
+                    completed_since_update = 0
+            pending.update(submit(item) for item in islice(files, len(done)))
+
+    if not args.dry_run:
+        save_cache(root, new_cache)
+
+    if log_thread is not None:
+        _log_q.put(None)
+        log_thread.join()
+
+    if progress is not None:
+        if completed_since_update:
+            progress.update(completed_since_update)
         progress.close()
 
     # summary
@@ -15,11 +15,11 @@ import os, sys, subprocess, threading, webbrowser
 from pathlib import Path
 from typing import List
 
-from PyQt5.QtCore import Qt, pyqtSignal, QObject
+from PyQt5.QtCore import Qt, pyqtSignal, QProcess, QTimer
 from PyQt5.QtGui import QTextCursor
 from PyQt5.QtWidgets import (
     QApplication, QFileDialog, QGridLayout, QHBoxLayout, QInputDialog,
-    QLineEdit, QPushButton, QSizePolicy, QTextEdit, QVBoxLayout, QWidget,
+    QLineEdit, QPlainTextEdit, QPushButton, QSizePolicy, QVBoxLayout, QWidget,
 )
 
 # ---------------------------------------------------------------------------
@@ -35,35 +35,32 @@ FLASK_APP_ENV  = "label_server.app:create_flask_app"
 FLASK_PORT     = "5000"
 
 # ---------------------------------------------------------------------------
-class StreamReader(QObject):
-    """Run a subprocess and stream stdout → Qt signal line‑by‑line."""
-    new_line = pyqtSignal(str)
-    finished = pyqtSignal(int)
+class StreamReader(QProcess):
+    """Run a subprocess and stream its merged stdout/stderr as Qt signals.
+
+    QProcess delivers ``readyReadStandardOutput`` on the GUI thread in
+    OS-pipe-sized chunks, so there is no helper thread and no per-line
+    cross-thread signal the way the old Popen+Thread pump had.
+    """
+    new_text = pyqtSignal(str)
+
+    def __init__(self, cmd: List[str], cwd: Path, parent=None):
+        super().__init__(parent)
+        self._cmd = cmd
+        self.setWorkingDirectory(str(cwd))
+        self.setProcessChannelMode(QProcess.MergedChannels)
+        self.readyReadStandardOutput.connect(self._on_ready_read)
+        self.errorOccurred.connect(
+            lambda _err: self.new_text.emit(f"[ERROR] {self.errorString()}\n")
+        )
 
-    def __init__(self, cmd: List[str], cwd: Path):
-        super().__init__()
-        self.cmd, self.cwd = cmd, cwd
-        self._thread = threading.Thread(target=self._run, daemon=True)
-
-    def start(self):
-        self._thread.start()
-
-    def _run(self):
-        try:
-            proc = subprocess.Popen(
-                self.cmd, cwd=self.cwd, text=True,
-                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1,
-            )
-        except FileNotFoundError as e:
-            self.new_line.emit(f"[ERROR] {e}\n")
-            self.finished.emit(1)
-            return
+    def start(self):  # noqa: A003 - mirrors the old StreamReader API
+        super().start(self._cmd[0], self._cmd[1:])
 
-        assert proc.stdout
-        for line in proc.stdout:
-            self.new_line.emit(line)
-        proc.wait()
-        self.finished.emit(proc.returncode)
+    def _on_ready_read(self):
+        self.new_text.emit(
+            bytes(self.readAllStandardOutput()).decode(errors="replace")
+        )
 
 # ---------------------------------------------------------------------------
 class MainWindow(QWidget):
@@ -97,11 +94,20 @@ class MainWindow(QWidget):
             self.btn_extract, self.btn_preview, self.btn_annotate, self.btn_apply, self.btn_subset
         )]
 
-        # Log area
-        self.log = QTextEdit(readOnly=True)
-        self.log.setLineWrapMode(QTextEdit.NoWrap)
+        # Log area.  QPlainTextEdit is much cheaper than QTextEdit for
+        # append-heavy logs; the block cap keeps relayout cost bounded on
+        # very long runs.
+        self.log = QPlainTextEdit(readOnly=True)
+        self.log.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.log.setMaximumBlockCount(10000)
         self.log.setStyleSheet("font-family: Consolas, monospace; font-size: 10pt;")
 
+        # Incoming text is buffered and flushed at ~20 Hz so a chatty
+        # subprocess costs one document relayout per tick, not per line.
+        self._log_buf: List[str] = []
+        self._log_timer = QTimer(self, interval=50, timeout=self._flush_log)
+        self._log_timer.start()
+
         # Layout
         grid = QGridLayout(self)
         grid.addLayout(path_row, 0, 0, 1, 2)
@@ -111,6 +117,13 @@ class MainWindow(QWidget):
 
     # ---------------- helpers ----------------
     def _append(self, text: str):
+        self._log_buf.append(text)
+
+    def _flush_log(self):
+        if not self._log_buf:
+            return
+        text = "".join(self._log_buf)
+        self._log_buf.clear()
         self.log.moveCursor(QTextCursor.End)
         self.log.insertPlainText(text)
         self.log.moveCursor(QTextCursor.End)
@@ -131,9 +144,11 @@ class MainWindow(QWidget):
     # ------------- run external cmds -------------
     def _run_cmd(self, cmd: List[str], tag: str):
         self._append(f"\n=== {tag} {' '.join(cmd)} ===\n")
-        runner = StreamReader(cmd, cwd=REPO_ROOT)
-        runner.new_line.connect(self._append)
-        runner.finished.connect(lambda rc: self._append(f"=== {tag} finished (rc={rc}) ===\n"))
+        runner = StreamReader(cmd, cwd=REPO_ROOT, parent=self)
+        runner.new_text.connect(self._append)
+        runner.finished.connect(
+            lambda rc, _status: self._append(f"=== {tag} finished (rc={rc}) ===\n")
+        )
         runner.start()
 
     def _do_extract(self):
@@ -13,18 +13,22 @@ extract_dicom_headers.py
 """
 from __future__ import annotations
 
-import argparse, csv, os, sys
+import argparse, csv, os, pickle, sys
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 from typing import Dict, Tuple, List, Optional
 
 import numpy as np
 import pydicom
 from pydicom.errors import InvalidDicomError
+from pydicom.tag import Tag
 from tqdm import tqdm
 
 SCRIPT_DIR   = Path(__file__).resolve().parent
 DEFAULT_TSV  = SCRIPT_DIR / "series_info.tsv"        # <── hard‑coded
+SCAN_CACHE   = SCRIPT_DIR / ".scan_cache.pkl"
 
 # -------------------------------------------------------------------- #
 # Tag → column‑name mapping
@@ -68,6 +72,24 @@ DICOM_FIELD_MAPPING: Dict[str, str] = OrderedDict(
 )
 FIELDS = list(DICOM_FIELD_MAPPING.keys())
 
+# Hex keys parsed to (group, element) once at import; the per-file loop
+# was re-running int(..., 16) for every field of every file.
+FIELD_TAGS: List[Tuple[str, Tuple[int, int]]] = [
+    (h, (int(h[:4], 16), int(h[4:], 16))) for h in FIELDS
+]
+
+# Restricting dcmread to these tags lets pydicom skip decoding everything
+# else (notably big vendor private blocks), which dominates read time on
+# enhanced/CSA-laden files.  The extras beyond FIELDS feed the plane and
+# slice-position fallbacks.
+SPECIFIC_TAGS = [Tag(*t) for _, t in FIELD_TAGS] + [
+    Tag(0x0020, 0x0032),  # ImagePositionPatient
+    Tag(0x0020, 0x0013),  # InstanceNumber
+    Tag(0x0020, 0x0020),  # PatientOrientation
+    Tag(0x5200, 0x9229),  # SharedFunctionalGroupsSequence
+    Tag(0x5200, 0x9230),  # PerFrameFunctionalGroupsSequence
+]
+
 EXAMPLE_COL = "Example File"
 PLANE_COL   = "Plane Orientation"
 HEADER_ROW  = list(DICOM_FIELD_MAPPING.values()) + [EXAMPLE_COL, PLANE_COL, "Annotation"]
@@ -76,15 +98,22 @@ HEADER_ROW  = list(DICOM_FIELD_MAPPING.values()) + [EXAMPLE_COL, PLANE_COL, "Ann
 # Orientation → plane helper
 # -------------------------------------------------------------------- #
 def determine_plane(ori: List[float]) -> str:
+    # Plain scalar arithmetic: NumPy dispatch costs far more than the
+    # nine multiplies of a 3-vector cross product.
     if len(ori) != 6:
         return ""
-    row, col = ori[:3], ori[3:]
-    normal = np.cross(row, col)
-    idx = int(np.argmax(np.abs(normal)))  # 0=x,1=y,2=z
-    major = np.abs(normal[idx])
+    a, b, c, d, e, f = (float(v) for v in ori)
+    ax = abs(b * f - c * e)
+    ay = abs(c * d - a * f)
+    az = abs(a * e - b * d)
+    major = max(ax, ay, az)
     if major < 0.8:  # > ~36° from any axis → oblique
         return "oblique"
-    return ("sagittal", "coronal", "axial")[idx]
+    if ax == major:
+        return "sagittal"
+    if ay == major:
+        return "coronal"
+    return "axial"
 
 def infer_plane_from_patient_orientation(po: str) -> str:
     if not po:
@@ -140,22 +169,48 @@ def _orientation_from_ds(ds: pydicom.Dataset) -> Optional[List[float]]:
     return None
 
 # -------------------------------------------------------------------- #
-def hex_tag(h: str) -> Tuple[int, int]:
-    return int(h[:4], 16), int(h[4:], 16)
+def has_dicm_magic(fp) -> bool:
+    """True if *fp* carries the 'DICM' marker at offset 128.
 
-def extract_header(fp: Path) -> Tuple[Dict[str, str], Optional[List[float]], int]:
+    A 132-byte read rejects non-DICOM files immediately, instead of
+    letting dcmread(force=True) chew through the whole file before
+    failing.
+    """
     try:
-        ds = pydicom.dcmread(fp, stop_before_pixels=True, force=True)
+        with open(fp, "rb") as fh:
+            fh.seek(128)
+            return fh.read(4) == b"DICM"
+    except OSError:
+        return False
+
+
+def extract_header(
+    fp: Path,
+) -> Tuple[Dict[str, str], Optional[List[float]], int, Optional[List[float]]]:
+    # Files with the Part-10 marker get the strict parse; only headerless
+    # raw datasets (no preamble/file meta) pay the force=True fallback,
+    # and true non-DICOM clutter still errors out of it immediately.
+    try:
+        ds = pydicom.dcmread(
+            fp,
+            stop_before_pixels=True,
+            specific_tags=SPECIFIC_TAGS,
+            defer_size=1024,
+            force=not has_dicm_magic(fp),
+        )
     except (InvalidDicomError, OSError):
-        return {}, None, 0
+        return {}, None, 0, None
     out: Dict[str, str] = {}
-    for key in FIELDS:
-        elem = ds.get(hex_tag(key))
-        out[key] = str(elem.value) if elem else ""
+    for hex_key, tag in FIELD_TAGS:
+        elem = ds.get(tag)
+        out[hex_key] = str(elem.value) if elem else ""
 
+    # Plane assignment from the 6-float orientation is deferred to one
+    # vectorized pass over the whole manifest; only the PatientOrientation
+    # string fallback stays per-file.
     ori = _orientation_from_ds(ds)
-    plane = determine_plane(ori) if ori else ""
-    if not plane:
+    plane = ""
+    if ori is None:
         po = ''
         if 'PatientOrientation' in ds:
             po_val = ds.PatientOrientation
@@ -168,84 +223,231 @@ def extract_header(fp: Path) -> Tuple[Dict[str, str], Optional[List[float]], int
 
     inst = int(ds.get((0x0020, 0x0013)).value) if ds.get((0x0020, 0x0013)) else 0
 
-    return out, pos, inst
+    return out, pos, inst, ori
+
+# Non-DICOM clutter that mixed archives commonly carry; filtering on the
+# name alone saves a full open + failed parse per file.
+_SKIP_NAMES = {"DICOMDIR", "LICENSE", "README"}
+_DICOM_EXTS = ("dcm", "ima", "dic")
+
+
+def _dicom_candidate(name: str) -> bool:
+    if name.startswith(".") or name in _SKIP_NAMES:
+        return False
+    if "." not in name:
+        return True  # extensionless files are usually DICOM
+    ext = name.rsplit(".", 1)[-1]
+    if ext.lower() in _DICOM_EXTS:
+        return True
+    # SOP-UID-named exports (1.2.840...) end in a numeric component, and
+    # anything longer than a plausible extension is no extension at all;
+    # both are candidates, not sidecars.
+    return ext.isdigit() or len(ext) > 4
+
 
 def find_files(root: Path, read_all: bool):
-    for d, _, files in os.walk(root):
+    """Yield candidate file paths (str) via os.scandir recursion.
+
+    DirEntry carries the file/dir answer from the directory read itself,
+    avoiding the per-entry stat that os.walk + Path construction costs on
+    large trees; pydicom accepts plain strings.  Hidden files and names
+    that cannot be DICOM are dropped before any open.
+    """
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        files: List[str] = []
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file(follow_symlinks=False) and _dicom_candidate(
+                        e.name
+                    ):
+                        files.append(e.path)
+        except OSError:
+            continue
         files.sort()
-        for f in (files if read_all else files[:5]):
-            yield Path(d) / f
+        for fp in files if read_all else files[:5]:
+            yield fp
+
+# -------------------------------------------------------------------- #
+def _load_scan_cache() -> dict:
+    try:
+        with SCAN_CACHE.open("rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError):
+        return {}
+
+
+def _save_scan_cache(cache: dict) -> None:
+    try:
+        with SCAN_CACHE.open("wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+
 
 # -------------------------------------------------------------------- #
 def build_series_manifest(root: Path, read_all: bool):
     manifest: Dict[Tuple[str,str], Dict[str,str]] = OrderedDict()
     pos_per_series: defaultdict[Tuple[str,str], List[Tuple[int, List[float]]]] = defaultdict(list)
 
-    for fp in tqdm(list(find_files(root, read_all)), desc="Reading headers"):
-        info, pos, inst = extract_header(fp)
+    # Results from previous runs are cached keyed on (path, mtime, size);
+    # a stat per file is enough to skip re-parsing unchanged headers, so
+    # incremental re-runs only pay for novel files.  Writing back just the
+    # keys seen this run prunes entries for deleted files.
+    cache = _load_scan_cache()
+    entries: List[Tuple[str, tuple]] = []
+    for fp in find_files(root, read_all):
+        try:
+            st = os.stat(fp)
+        except OSError:
+            continue
+        entries.append((fp, (fp, st.st_mtime_ns, st.st_size)))
+
+    to_scan = [fp for fp, key in entries if key not in cache]
+    scanned: Dict[str, tuple] = {}
+    if to_scan:
+        # Header parsing is per-file CPU + I/O bound with no shared state,
+        # so fan it out over a process pool; aggregation stays here.
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            results = ex.map(extract_header, to_scan, chunksize=64)
+            for fp, res in zip(
+                to_scan,
+                tqdm(results, total=len(to_scan), desc="Reading headers"),
+            ):
+                scanned[fp] = res
+
+    new_cache: dict = {}
+    ori_rows: List[Tuple[Tuple[str, str], List[float]]] = []
+    for fp, key in entries:
+        res = cache.get(key)
+        if res is None or len(res) != 4:  # miss or stale cache format
+            res = scanned.get(fp, ({}, None, 0, None))
+        new_cache[key] = res
+        info, pos, inst, ori = res
         if not info:
             continue
         study_uid = info.get("0020000D", "")
         series_uid = info.get("0020000E", "")
         if not (study_uid and series_uid):
             continue
-        key = (study_uid, series_uid)
-        if key not in manifest:
-            info[EXAMPLE_COL] = str(fp)
-            manifest[key] = info
+        skey = (study_uid, series_uid)
+        if skey not in manifest:
+            # copy so EXAMPLE_COL/plane fixes don't leak into the cache
+            row = dict(info)
+            row[EXAMPLE_COL] = str(fp)
+            manifest[skey] = row
+            if ori is not None and not row[PLANE_COL]:
+                ori_rows.append((skey, ori))
         if pos:
-            pos_per_series[key].append((inst, pos))
+            pos_per_series[skey].append((inst, pos))
+    _save_scan_cache(new_cache)
+
+    # One vectorized plane assignment for every series with an
+    # orientation: per-series np.cross/argmax on 3-vectors is all dispatch
+    # overhead, so batch them into a single (N, 6) pass.
+    if ori_rows:
+        ori_mat = np.asarray([o for _, o in ori_rows], dtype=np.float32)
+        normals = np.cross(ori_mat[:, :3], ori_mat[:, 3:])
+        absn = np.abs(normals)
+        idx = absn.argmax(axis=1)
+        major = absn[np.arange(len(ori_rows)), idx]
+        plane_ids = np.where(major < 0.8, 3, idx)
+        names = np.array(["sagittal", "coronal", "axial", "oblique"])
+        for (skey, _), plane in zip(ori_rows, names[plane_ids]):
+            manifest[skey][PLANE_COL] = str(plane)
 
     # Fallback inference for series without plane (position changes)
-    for key, row in manifest.items():
+    for skey, row in manifest.items():
         if row[PLANE_COL]:
             continue  # already set
-        poss = pos_per_series[key]
+        poss = pos_per_series[skey]
         if len(poss) < 2:
             continue
         poss.sort(key=lambda x: x[0])
-        p1 = np.array(poss[0][1])
-        p2 = np.array(poss[1][1])
-        delta = p2 - p1
-        if np.linalg.norm(delta) == 0:
+        p1, p2 = poss[0][1], poss[1][1]
+        dx = abs(p2[0] - p1[0])
+        dy = abs(p2[1] - p1[1])
+        dz = abs(p2[2] - p1[2])
+        norm = (dx * dx + dy * dy + dz * dz) ** 0.5
+        if norm == 0:
             continue
-        norm_delta = delta / np.linalg.norm(delta)
-        idx = int(np.argmax(np.abs(norm_delta)))
-        major = np.abs(norm_delta[idx])
+        major = max(dx, dy, dz) / norm
         if major < 0.8:
             row[PLANE_COL] = "oblique"
+        elif dx >= dy and dx >= dz:
+            row[PLANE_COL] = "sagittal"
+        elif dy >= dz:
+            row[PLANE_COL] = "coronal"
         else:
-            row[PLANE_COL] = ("sagittal", "coronal", "axial")[idx]
+            row[PLANE_COL] = "axial"
 
     return manifest
 
+# Column order used by both reader and writer; matches HEADER_ROW but is
+# keyed the way the in-memory rows are (hex tags + the three extras).
+ROW_KEYS = FIELDS + [EXAMPLE_COL, PLANE_COL, "Annotation"]
+
+
 def merge_existing(out_tsv: Path, fresh):
+    """Fold annotations/rows from an existing TSV into *fresh*, in place.
+
+    *fresh* is freshly built by build_series_manifest with no other
+    aliases, so mutating it avoids an O(N) dict copy and the doubled peak
+    memory that came with it.
+    """
     if not out_tsv.exists():
         return fresh
-    merged = fresh.copy()
-    with out_tsv.open(newline="") as f:
-        rdr = csv.DictReader(f, delimiter="\t")
+    merged = fresh
+    with out_tsv.open(newline="", buffering=1 << 20) as f:
+        rdr = csv.reader(f, delimiter="\t")
+        header = next(rdr, None)
+        if not header:
+            return merged
+        # One-time column-index lookup instead of a dict per row.
+        idx = {name: i for i, name in enumerate(header)}
+
+        def col_of(*names: str) -> int:
+            for n in names:
+                if n in idx:
+                    return idx[n]
+            return -1
+
+        study_i  = col_of("Study Instance UID", "0020000D")
+        series_i = col_of("Series Instance UID", "0020000E")
+        ex_i     = col_of(EXAMPLE_COL)
+        plane_i  = col_of(PLANE_COL)
+        annot_i  = col_of("Annotation")
+        tag_cols = [(tag, col_of(DICOM_FIELD_MAPPING[tag])) for tag in FIELDS]
+
+        def cell(row, i):
+            return row[i] if 0 <= i < len(row) else ""
+
         for row in rdr:
-            key = (row.get("Study Instance UID") or row.get("0020000D",""),
-                   row.get("Series Instance UID") or row.get("0020000E",""))
+            key = (cell(row, study_i), cell(row, series_i))
             if key not in merged:
-                merged[key] = {tag: row.get(DICOM_FIELD_MAPPING[tag], "")
-                               for tag in FIELDS}
-            merged[key][EXAMPLE_COL] = row.get(EXAMPLE_COL, merged[key].get(EXAMPLE_COL,""))
-            merged[key][PLANE_COL]   = row.get(PLANE_COL,   merged[key].get(PLANE_COL,""))
-            merged[key]["Annotation"]= row.get("Annotation","")
+                merged[key] = {tag: cell(row, i) for tag, i in tag_cols}
+            merged[key][EXAMPLE_COL] = cell(row, ex_i) or merged[key].get(EXAMPLE_COL, "")
+            merged[key][PLANE_COL]   = cell(row, plane_i) or merged[key].get(PLANE_COL, "")
+            merged[key]["Annotation"] = cell(row, annot_i)
     return merged
 
 def write_manifest(data, out_tsv: Path):
-    with out_tsv.open("w", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=HEADER_ROW, delimiter="\t")
-        w.writeheader()
-        for info in data.values():
-            row = {DICOM_FIELD_MAPPING[k]: info.get(k,"") for k in FIELDS}
-            row[EXAMPLE_COL] = info.get(EXAMPLE_COL,"")
-            row[PLANE_COL]   = info.get(PLANE_COL,"")
-            row["Annotation"]= info.get("Annotation","")
-            w.writerow(row)
+    # A 1 MiB buffer turns the per-row write() calls the csv module makes
+    # into a handful of syscalls for the whole manifest.
+    with out_tsv.open("w", newline="", buffering=1 << 20) as f:
+        w = csv.writer(f, delimiter="\t")
+        w.writerow(HEADER_ROW)
+        rows = ([info.get(k, "") for k in ROW_KEYS] for info in data.values())
+        while True:
+            chunk = list(islice(rows, 1000))
+            if not chunk:
+                break
+            w.writerows(chunk)
+            f.flush()
 
 # -------------------------------------------------------------------- #
 def parse_args() -> argparse.Namespace:
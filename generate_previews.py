@@ -8,8 +8,9 @@ generate_previews.py – final, fault‑tolerant
 """
 from __future__ import annotations
 
-import argparse, json, multiprocessing, sys, traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse, importlib.util, io, json, os, sys, traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import Dict, List, Tuple
 
@@ -24,34 +25,135 @@ SCRIPT_DIR   = Path(__file__).resolve().parent
 MANIFEST_TSV = SCRIPT_DIR / "series_info.tsv"
 PREVIEWS_DIR = SCRIPT_DIR / "previews"
 EXAMPLE_COL  = "Example File"
+
+# pydicom 3 picks up pylibjpeg/gdcm decoding plugins automatically when
+# installed; without one, compressed transfer syntaxes (J2K, JPEG-LS, RLE)
+# either fail or fall back to slow pure-Python paths.
+HAVE_FAST_DECODERS = any(
+    importlib.util.find_spec(m) for m in ("pylibjpeg", "gdcm")
+)
 # ------------------------------------------------------------------------
 
 
 # --------------------------- helpers ------------------------------------
 def normalize_uint8(arr: np.ndarray) -> np.ndarray:
-    lo, hi = np.percentile(arr.astype(np.float32), (1, 99))
+    flat = arr.ravel()
+    if arr.dtype.kind in "ui" and arr.itemsize <= 2:
+        # 12/16-bit integer pixels: exact percentiles from one bincount
+        # pass + cumulative sum — O(n + 65536) with a single sweep over
+        # memory, cheaper than any selection on the values themselves.
+        mn = int(flat.min())
+        offset = min(mn, 0)
+        data = flat if offset == 0 else flat.astype(np.int32) - offset
+        cdf = np.cumsum(np.bincount(data))
+        lo = float(np.searchsorted(cdf, 0.01 * cdf[-1]) + offset)
+        hi = float(np.searchsorted(cdf, 0.99 * cdf[-1]) + offset)
+        if hi <= lo:
+            lo, hi = float(flat.min()), float(flat.max())
+        if hi <= lo:  # constant image
+            hi = lo + 1.0
+        # Quantize through a per-image LUT over the (already counted)
+        # value range: the only full-frame buffer is the uint8 output,
+        # never a float temporary.
+        levels = np.arange(cdf.size, dtype=np.float32)
+        levels += np.float32(offset - lo)
+        levels *= np.float32(255.0 / (hi - lo))
+        lut = np.clip(levels, 0, 255, out=levels).astype(np.uint8)
+        return lut[data].reshape(arr.shape)
+    else:
+        # Float data: O(n) partition selection on a strided subsample.
+        sample = flat[:: max(1, flat.size // 65536)]
+        n = sample.size
+        k_lo = int(0.01 * (n - 1))
+        k_hi = int(0.99 * (n - 1))
+        part = np.partition(sample, (k_lo, k_hi))
+        lo, hi = float(part[k_lo]), float(part[k_hi])
     if hi <= lo:
-        lo, hi = arr.min(), arr.max() or 1
-    return ((np.clip(arr, lo, hi) - lo) / (hi - lo) * 255).astype(np.uint8)
+        lo, hi = float(flat.min()), float(flat.max())
+    if hi <= lo:  # constant image
+        hi = lo + 1.0
+    # copy=False fuses this step with to_grayscale: the luma matmul hands
+    # over a fresh float32 buffer, so the scale runs in place on it and
+    # the only remaining allocation is the uint8 output.
+    tmp = arr.astype(np.float32, copy=False)
+    np.subtract(tmp, np.float32(lo), out=tmp)
+    np.multiply(tmp, np.float32(255.0 / (hi - lo)), out=tmp)
+    np.clip(tmp, 0, 255, out=tmp)
+    return tmp.astype(np.uint8)
+
+
+# BT.601 luma weights; a single float32 matmul replaces the channel mean,
+# which walked memory three times and produced a float64 buffer.
+_BT601 = np.array([0.299, 0.587, 0.114], dtype=np.float32)
 
 
 def to_grayscale(arr: np.ndarray) -> np.ndarray:
     if arr.ndim == 2:
         return arr
     if arr.ndim == 3:
-        return arr.mean(axis=-1)
+        if arr.shape[-1] == 3:
+            return arr.astype(np.float32, copy=False) @ _BT601
+        return arr.mean(axis=-1, dtype=np.float32)
     raise ValueError("Unsupported pixel array shape")
 
 
+# Previews are navigational thumbnails, so encode at most 256 px on the
+# long side; WebP cost is linear in pixel count and method=0 picks the
+# fastest encoder profile.
+THUMB_SIZE = (256, 256)
+
+
+def save_array(arr: np.ndarray, dst: Path):
+    img = Image.fromarray(normalize_uint8(to_grayscale(arr)), mode="L")
+    img.thumbnail(THUMB_SIZE, Image.Resampling.BILINEAR)
+    # Encode in memory and hit the filesystem with one write; previews
+    # are a few KB, so the encoder's incremental writes were all syscall
+    # overhead.
+    buf = io.BytesIO()
+    img.save(buf, format="WEBP", quality=80, method=0)
+    dst.write_bytes(buf.getbuffer())
+
+
+def _decompress_if_needed(ds: pydicom.Dataset) -> None:
+    """Run the C decoder plugin once, up front, for compressed syntaxes.
+
+    After this, ``pixel_array`` is a plain frombuffer/reshape over the
+    native-endian buffer instead of decoding lazily inside numpy-side
+    bookkeeping; uncompressed datasets pass through untouched.
+    """
+    try:
+        if ds.file_meta.TransferSyntaxUID.is_compressed:
+            ds.decompress()
+    except AttributeError:
+        pass  # no file meta (force-read bare dataset): leave it lazy
+
+
 def save_slice(ds: pydicom.Dataset, dst: Path):
-    Image.fromarray(normalize_uint8(to_grayscale(ds.pixel_array)), mode="L") \
-         .save(dst, format="WEBP", quality=85)
+    save_array(ds.pixel_array, dst)
+
+
+def render_slice(src, dst: Path):
+    """Decode one file and write its preview.
+
+    Keeping the dataset local to this frame means the decoded pixel
+    array is freed as soon as the WebP is written, instead of staying
+    referenced across the rest of the sampling loop.
+    """
+    ds = dcmread(src, force=True)
+    if "PixelData" not in ds or getattr(ds, "SamplesPerPixel", 1) not in (1, 3):
+        raise AttributeError("no usable PixelData")
+    _decompress_if_needed(ds)
+    save_slice(ds, dst)
 
 
 def choose_indices(n: int, k: int = 8) -> List[int]:
     return list(range(n)) if n <= k else [round(i * (n - 1) / (k - 1)) for i in range(k)]
 
 
+def _wanted(uid: str, n: int) -> set:
+    return {f"{uid}_slice{i}.webp" for i in range(min(8, n))}
+
+
 def load_manifest() -> Dict[str, Path]:
     if not MANIFEST_TSV.exists():
         sys.exit(f"[ERROR] Manifest {MANIFEST_TSV} not found")
@@ -75,49 +177,91 @@ def process_series(
     example_path: Path,
     overwrite: bool,
     verbose: bool,
-) -> Tuple[str, int]:
+    existing: frozenset[str] = frozenset(),
+) -> Tuple[str, int, dict | None]:
+    """Render previews for one series; ``existing`` is a snapshot of
+    PREVIEWS_DIR filenames taken once per run, so completeness checks are
+    set lookups instead of per-series directory scans."""
     count = 0
     if overwrite:
         for old in PREVIEWS_DIR.glob(f"{uid}_slice*.webp"):
             old.unlink(missing_ok=True)
+        # legacy per-series sidecar from before the shared index.json
         (PREVIEWS_DIR / f"{uid}.json").unlink(missing_ok=True)
-    elif (PREVIEWS_DIR / f"{uid}_slice0.webp").exists():
-        return uid, 0
 
     series_dir = example_path.parent
     if not series_dir.exists():
         if verbose:
             print(f"[WARN] {uid}: directory not found {series_dir}")
-        return uid, 0
+        return uid, 0, None
 
-    files = sorted(p for p in series_dir.iterdir()
-                   if p.suffix.lower() in {".dcm", ".ima"} and p.is_file())
+    try:
+        with os.scandir(series_dir) as it:
+            files = sorted(
+                e.path
+                for e in it
+                if e.is_file(follow_symlinks=False)
+                and e.name.lower().endswith((".dcm", ".ima"))
+            )
+    except OSError:
+        files = []
     if not files:
         if verbose:
             print(f"[WARN] {uid}: no DICOMs")
-        return uid, 0
+        return uid, 0, None
+
+    # Enhanced MR/CT keeps the whole series in one multi-frame file;
+    # decode its pixel data once and slice the frame axis instead of
+    # re-reading the file per preview.
+    if len(files) == 1:
+        try:
+            ds = dcmread(files[0], force=True)
+            n_frames = int(getattr(ds, "NumberOfFrames", 1) or 1)
+        except Exception:
+            n_frames = 1
+        if n_frames > 1 and "PixelData" in ds:
+            if not overwrite and _wanted(uid, n_frames) <= existing:
+                return uid, 0, None
+            try:
+                _decompress_if_needed(ds)
+                frames = ds.pixel_array
+            except Exception as exc:
+                if verbose:
+                    print(f"[SKIP] {uid} {Path(files[0]).name}: {exc}")
+                return uid, 0, None
+            for i, idx in enumerate(choose_indices(n_frames)):
+                dst = PREVIEWS_DIR / f"{uid}_slice{i}.webp"
+                try:
+                    save_array(frames[idx], dst)
+                    count += 1
+                except Exception as exc:
+                    if verbose:
+                        print(f"[SKIP] {uid} frame {idx}: {exc}")
+            meta = dict(uid=uid, total=n_frames, written=count,
+                        folder=str(series_dir))
+            return uid, count, meta if count else None
+
+    # Skip only when every expected slice target is present: checking
+    # slice0 alone used to mis-skip series where a prior run died midway.
+    if not overwrite and _wanted(uid, len(files)) <= existing:
+        return uid, 0, None
 
     for i, idx in enumerate(choose_indices(len(files))):
         src, dst = files[idx], PREVIEWS_DIR / f"{uid}_slice{i}.webp"
         try:
-            ds = dcmread(src, force=True)
-            if "PixelData" not in ds or getattr(ds, "SamplesPerPixel", 1) not in (1, 3):
-                raise AttributeError("no usable PixelData")
-            save_slice(ds, dst)
+            render_slice(src, dst)
             count += 1
         except (InvalidDicomError, AttributeError, NotImplementedError,
                 OSError, ValueError) as exc:
             if verbose:
-                print(f"[SKIP] {uid} {src.name}: {exc}")
+                print(f"[SKIP] {uid} {Path(src).name}: {exc}")
         except Exception as exc:
             if verbose:
                 traceback.print_exc()
-                print(f"[FAIL] {uid} {src.name}: {exc}")
+                print(f"[FAIL] {uid} {Path(src).name}: {exc}")
 
-    if count:
-        meta = dict(uid=uid, total=len(files), written=count, folder=str(series_dir))
-        (PREVIEWS_DIR / f"{uid}.json").write_text(json.dumps(meta))
-    return uid, count
+    meta = dict(uid=uid, total=len(files), written=count, folder=str(series_dir))
+    return uid, count, meta if count else None
 # ------------------------------------------------------------------------
 
 
@@ -134,22 +278,46 @@ def main():
 
     series_map = load_manifest()
     print(f"[INFO] {len(series_map):,} series in manifest")
+    if not HAVE_FAST_DECODERS:
+        print("[WARN] pylibjpeg/gdcm not installed - compressed DICOMs "
+              "will decode slowly or fail (see environment.yml)")
 
-    max_workers = max(4, multiprocessing.cpu_count() * 2)
+    # Decode + normalize + WebP encode are CPU-bound and mostly hold the
+    # GIL, so processes scale with cores where threads serialized.
+    max_workers = os.cpu_count() or 4
     written_total, skipped = 0, 0
 
-    with ThreadPoolExecutor(max_workers=max_workers) as pool:
-        futures = [pool.submit(process_series, uid, ex_path,
-                               args.overwrite, args.verbose)
-                   for uid, ex_path in series_map.items()]
-        for fut in tqdm(as_completed(futures), total=len(futures),
-                        desc="Generating previews"):
-            _uid, n = fut.result()
+    # One shared sidecar instead of a JSON file per series: merged with
+    # the previous run's entries so skipped series keep their metadata.
+    index_path = PREVIEWS_DIR / "index.json"
+    try:
+        index = json.loads(index_path.read_text())
+    except (OSError, ValueError):
+        index = {}
+
+    # map() with a chunksize dispatches lazily instead of allocating one
+    # work item per series up front, which matters once the manifest runs
+    # to tens of thousands of rows.
+    try:
+        existing = frozenset(e.name for e in os.scandir(PREVIEWS_DIR))
+    except OSError:
+        existing = frozenset()
+    func = partial(process_series, overwrite=args.overwrite,
+                   verbose=args.verbose, existing=existing)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for uid, n, meta in tqdm(pool.map(func, series_map.keys(),
+                                          series_map.values(), chunksize=16),
+                                 total=len(series_map),
+                                 desc="Generating previews"):
+            if meta:
+                index[uid] = meta
             if n:
                 written_total += n
             else:
                 skipped += 1
 
+    index_path.write_text(json.dumps(index, indent=2))
+
     print(f"Wrote {written_total} WebP slices "
           f"({len(series_map) - skipped} series). {skipped} series skipped.")
     print("Output:", PREVIEWS_DIR.resolve())
@@ -31,20 +31,101 @@ DEFAULT_PREVIEWS = Path("previews")
 # ------------------------------------------------------------------ #
 # Helpers
 # ------------------------------------------------------------------ #
-def load_manifest(tsv: Path) -> List[dict[str, str]]:
-    if not tsv.exists():
-        return []
+# Parsed-manifest cache keyed by path: every page hit was re-reading,
+# re-dictifying, re-grouping, and re-counting the whole TSV.  Rows are
+# stored column-wise — one list per column plus lightweight row views —
+# so the column names exist once instead of as per-row dict keys, and
+# column scans (progress counter, study grouping) walk flat lists.  The
+# mtime check keeps external edits (e.g. re-running
+# extract_dicom_headers) visible.
+_manifest_cache: dict[str, dict] = {}
+
+_EMPTY_STATE = {"rows": [], "cols": {}, "by_study": {},
+                "study_ids": [], "done_count": 0}
+
+
+class RowView:
+    """Dict-like view of one manifest row held in column-wise storage."""
+    __slots__ = ("_cols", "_i")
+
+    def __init__(self, cols: dict[str, list[str]], i: int):
+        self._cols = cols
+        self._i = i
+
+    def __getitem__(self, key: str) -> str:
+        return self._cols[key][self._i]
+
+    def __setitem__(self, key: str, value: str):
+        self._cols[key][self._i] = value
+
+    def get(self, key: str, default: str = "") -> str:
+        col = self._cols.get(key)
+        return col[self._i] if col is not None else default
+
+    def keys(self):
+        return self._cols.keys()
+
+
+def _manifest_state(tsv: Path) -> dict:
+    try:
+        mtime = tsv.stat().st_mtime_ns
+    except OSError:
+        return _EMPTY_STATE
+    cached = _manifest_cache.get(str(tsv))
+    if cached is not None and cached["mtime"] == mtime:
+        return cached
     with tsv.open(newline="") as f:
-        return list(csv.DictReader(f, delimiter="\t"))
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, [])
+        cols: dict[str, list[str]] = {name: [] for name in header}
+        col_lists = list(cols.values())
+        n_cols = len(col_lists)
+        for rec in reader:
+            if len(rec) < n_cols:
+                rec = rec + [""] * (n_cols - len(rec))
+            for lst, val in zip(col_lists, rec):
+                lst.append(val)
+    n_rows = len(col_lists[0]) if col_lists else 0
+    rows = [RowView(cols, i) for i in range(n_rows)]
+    by_study: dict[str, list[RowView]] = defaultdict(list)
+    for i, study in enumerate(cols.get("Study Instance UID", ())):
+        by_study[study].append(rows[i])
+    state = {
+        "mtime": mtime,
+        "rows": rows,
+        "cols": cols,
+        "by_study": dict(by_study),
+        "study_ids": sorted(by_study),
+        "done_count": sum(1 for v in cols.get("Annotation", ()) if v),
+    }
+    _manifest_cache[str(tsv)] = state
+    return state
+
+
+def load_manifest(tsv: Path) -> List[RowView]:
+    return _manifest_state(tsv)["rows"]
 
 def save_manifest(tsv: Path, rows: List[dict[str, str]]):
     if not rows:
         return
+    # Plain tab-joins instead of DictWriter's per-row fieldname lookups;
+    # stray tabs/newlines (possible in free-text annotations) are
+    # flattened to spaces since this format never quotes.
+    keys = list(rows[0].keys())
+    lines = ["\t".join(keys)]
+    lines.extend(
+        "\t".join(
+            (r.get(k) or "").replace("\t", " ").replace("\n", " ")
+            for k in keys
+        )
+        for r in rows
+    )
     tmp = tsv.with_suffix(".tmp")
-    with tmp.open("w", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=rows[0].keys(), delimiter="\t")
-        w.writeheader(); w.writerows(rows)
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
     tmp.replace(tsv)
+    # rows may alias the cached list with mutated Annotations; drop the
+    # entry so the next load re-reads what actually hit disk
+    _manifest_cache.pop(str(tsv), None)
 
 def load_labels(path: Path) -> List[str]:
     if not path.exists():
@@ -56,10 +137,38 @@ def load_labels(path: Path) -> List[str]:
             out.append(l); seen.add(l)
     return out
 
+# Known-labels cache keyed by path and mtime; appending used to re-read
+# and fully rewrite the file per label, going quadratic over a session.
+_labels_cache: dict[str, tuple[int, set[str]]] = {}
+
+
+def _known_labels(path: Path) -> set[str]:
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        mtime = -1
+    cached = _labels_cache.get(str(path))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    known = set(load_labels(path))
+    _labels_cache[str(path)] = (mtime, known)
+    return known
+
+
+def append_labels(path: Path, labels) -> None:
+    """Append the labels not already in the file, in one true append."""
+    known = _known_labels(path)
+    fresh = [l for l in (lab.strip() for lab in labels) if l and l not in known]
+    if not fresh:
+        return
+    with path.open("a") as f:
+        f.writelines(l + "\n" for l in fresh)
+    known.update(fresh)
+    _labels_cache[str(path)] = (path.stat().st_mtime_ns, known)
+
+
 def append_label(path: Path, new: str):
-    new = new.strip()
-    if new and new not in load_labels(path):
-        path.write_text(path.read_text() + new + "\n" if path.exists() else new + "\n")
+    append_labels(path, (new,))
 
 # ------------------------------------------------------------------ #
 # Factory
@@ -86,24 +195,20 @@ def create_flask_app(*, manifest_path: Path | None = None,
 
     @app.route("/page/<int:page_num>")
     def page(page_num: int):
-        rows   = load_manifest(app.config["MANIFEST_PATH"])
+        state  = _manifest_state(app.config["MANIFEST_PATH"])
         labels = load_labels(app.config["LABELS_PATH"])
 
-        # --- group by Study UID ------------------------------------------------
-        studies: dict[str, list[dict[str, str]]] = defaultdict(list)
-        for r in rows:
-            studies[r["Study Instance UID"]] .append(r)
-        study_ids = sorted(studies)
+        study_ids = state["study_ids"]
         total_pages = len(study_ids) or 1
 
         if page_num < 1 or page_num > total_pages:
             return redirect(url_for("page", page_num=1))
 
         study_uid   = study_ids[page_num-1]
-        series_batch = studies[study_uid]
+        series_batch = state["by_study"][study_uid]
 
-        done       = sum(1 for r in rows if r.get("Annotation"))
-        remaining  = len(rows) - done
+        done       = state["done_count"]
+        remaining  = len(state["rows"]) - done
 
         return render_template(
             "page.html",
@@ -122,28 +227,36 @@ def create_flask_app(*, manifest_path: Path | None = None,
             flash("No annotations submitted.", "warning")
             return redirect(url_for("page", page_num=page_num))
 
-        rows = load_manifest(app.config["MANIFEST_PATH"])
-        changed = 0
+        state = _manifest_state(app.config["MANIFEST_PATH"])
+        rows = state["rows"]
+        changed, new_labels = 0, set()
         for r in rows:
             uid = r.get("Series Instance UID")
             if uid in annos and r.get("Annotation") != annos[uid]:
                 r["Annotation"] = annos[uid]; changed += 1
-                append_label(app.config["LABELS_PATH"], annos[uid])
+                new_labels.add(annos[uid])
 
         if changed:
+            append_labels(app.config["LABELS_PATH"], new_labels)
             save_manifest(app.config["MANIFEST_PATH"], rows)
             flash(f"Saved {changed} annotation(s).", "success")
         else:
             flash("Nothing new to save.", "info")
 
         next_page = page_num + 1
-        if next_page > (len(set(r["Study Instance UID"] for r in rows)) or 1):
+        if next_page > (len(state["study_ids"]) or 1):
             next_page = 1
         return redirect(url_for("page", page_num=next_page))
 
     @app.route("/previews/<path:filename>")
     def previews(filename: str):
-        return send_from_directory(app.config["PREVIEWS_DIR"], filename)
+        # Preview names are content-addressed (UID + slice index), so the
+        # browser may cache them hard; conditional=True answers repeat
+        # fetches with 304s and serves ranges via the sendfile path.
+        resp = send_from_directory(app.config["PREVIEWS_DIR"], filename,
+                                   conditional=True, max_age=86400)
+        resp.headers["Cache-Control"] = "public, max-age=86400, immutable"
+        return resp
 
     return app
 
@@ -18,4 +18,5 @@ from .image_utils import (                 # noqa: F401
     normalize_to_uint8,
     save_numpy_to_webp,
     save_dataset_slice,
+    save_dataset_slices,
 )
@@ -12,11 +12,36 @@ from __future__ import annotations
 
 import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, Iterator, List, Tuple
 
 import pydicom
 from pydicom.errors import InvalidDicomError
+from pydicom.tag import Tag
+
+# The series walk only needs these two tags; specific_tags lets pydicom
+# skip decoding the rest of the header.
+_GATHER_TAGS = [Tag(0x0020, 0x000E), Tag(0x0020, 0x0013)]
+
+# Name-level prefilter: hidden/system files and common sidecar
+# extensions never reach dcmread.
+_SKIP_NAMES = {"DICOMDIR", "LICENSE", "README"}
+_DICOM_EXTS = ("dcm", "ima", "dic")
+
+
+def _dicom_candidate(name: str) -> bool:
+    if name.startswith(".") or name in _SKIP_NAMES:
+        return False
+    if "." not in name:
+        return True  # extensionless files are usually DICOM
+    ext = name.rsplit(".", 1)[-1]
+    if ext.lower() in _DICOM_EXTS:
+        return True
+    # SOP-UID-named exports (1.2.840...) end in a numeric component, and
+    # anything longer than a plausible extension is no extension at all;
+    # both are candidates, not sidecars.
+    return ext.isdigit() or len(ext) > 4
 
 ###############################################################################
 # Tag helpers
@@ -41,16 +66,18 @@ def read_header(
 
     If *strict* is True, raises on invalid DICOM; else returns {}.
     """
+    tags = [Tag(*hex_to_tag(h)) for h in fields]
     try:
-        ds = pydicom.dcmread(dcm_path, stop_before_pixels=True, force=True)
+        ds = pydicom.dcmread(
+            dcm_path, stop_before_pixels=True, specific_tags=tags, force=True
+        )
     except InvalidDicomError:
         if strict:
             raise
         return {}
 
     out: Dict[str, str] = {}
-    for tag_hex in fields:
-        tag = hex_to_tag(tag_hex)
+    for tag_hex, tag in zip(fields, tags):
         out[tag_hex] = str(ds.get(tag, ""))
     return out
 
@@ -69,14 +96,26 @@ def safe_instance_number(ds: pydicom.Dataset, default: int = -1) -> int:
 
 
 def sort_slices_by_instance(file_list: List[Path]) -> List[Path]:
-    """Return *file_list* sorted by InstanceNumber (fallback filename)."""
-    def key(fp: Path):
+    """Return *file_list* sorted by InstanceNumber (fallback filename).
+
+    Decorate-sort-undecorate: every header is read exactly once up
+    front, then the sort runs on the cached integers with no I/O.
+    """
+    decorated = []
+    for fp in file_list:
         try:
-            ds = pydicom.dcmread(fp, stop_before_pixels=True, force=True)
-            return safe_instance_number(ds)
+            ds = pydicom.dcmread(
+                fp,
+                stop_before_pixels=True,
+                specific_tags=[Tag(0x0020, 0x0013)],
+                force=True,
+            )
+            inst = safe_instance_number(ds)
         except Exception:
-            return -1
-    return sorted(file_list, key=key)
+            inst = -1
+        decorated.append((inst, fp))
+    decorated.sort(key=lambda t: t[0])
+    return [fp for _, fp in decorated]
 
 
 def choose_slice_indices(n_slices: int, n_pick: int = 8) -> List[int]:
@@ -95,23 +134,107 @@ def choose_slice_indices(n_slices: int, n_pick: int = 8) -> List[int]:
 ###############################################################################
 
 
+def _has_dicm_magic(path: str) -> bool:
+    """Cheap 132-byte preflight for the 'DICM' marker at offset 128."""
+    try:
+        with open(path, "rb") as fh:
+            fh.seek(128)
+            return fh.read(4) == b"DICM"
+    except OSError:
+        return False
+
+
+def _read_uid_inst(path: str) -> Tuple[str | None, int]:
+    """Return (SeriesInstanceUID, InstanceNumber) or (None, -1)."""
+    # Strict parse when the Part-10 marker is present; headerless raw
+    # datasets fall back to force=True, and non-DICOM files fail the
+    # forced parse at the missing SeriesInstanceUID.
+    try:
+        ds = pydicom.dcmread(
+            path,
+            stop_before_pixels=True,
+            specific_tags=_GATHER_TAGS,
+            defer_size=1024,
+            force=not _has_dicm_magic(path),
+        )
+        return str(ds.SeriesInstanceUID), safe_instance_number(ds)
+    except Exception:
+        return None, -1
+
+
+def _gather_folder(files: List[str]) -> List[Tuple[str, int, str]]:
+    """Resolve (uid, instance, path) triples for one folder's sorted files.
+
+    First/last probe as in gather_series_files; top-level so it can run
+    in a worker process.
+    """
+    uid0, inst0 = _read_uid_inst(files[0])
+    if len(files) == 1:
+        uid1, inst1 = uid0, inst0
+    else:
+        uid1, inst1 = _read_uid_inst(files[-1])
+    if uid0 is not None and uid0 == uid1:
+        # Single-series folder: name order stands in for instance order,
+        # anchored at the first file's InstanceNumber — but only when the
+        # last file's InstanceNumber agrees with the extrapolation.
+        # Unpadded names (1, 10, 2, ...), gaps and descending numbering
+        # all fail this check and take the per-file parse instead.
+        base = inst0 if inst0 >= 0 else 1
+        if inst1 == base + len(files) - 1:
+            return [(uid0, base + i, fp) for i, fp in enumerate(files)]
+
+    # Mixed, misordered or unreadable folder: parse every file individually.
+    out: List[Tuple[str, int, str]] = []
+    for fp in files:
+        uid, inst = _read_uid_inst(fp)
+        if uid is not None:
+            out.append((uid, inst, fp))
+    return out
+
+
 def gather_series_files(root: Path) -> Dict[str, List[Path]]:
     """
     Walk *root* and build {SeriesInstanceUID: [paths sorted by InstanceNumber]}.
+
+    A series almost always occupies its own folder, so each folder is
+    probed with just its first and last file (sorted by name): if both
+    report the same series UID the whole folder is assigned to it without
+    parsing the files in between, and folders where the probe disagrees
+    fall back to parsing every file.  The walk itself is cheap, so the
+    per-folder probing/parsing is fanned out over a process pool and
+    aggregated here, fusing UID grouping and instance capture in one
+    pass.
     """
-    series: Dict[str, List[Path]] = defaultdict(list)
-    for dirpath, _dirs, files in os.walk(root):
-        for fname in files:
-            fpath = Path(dirpath) / fname
-            try:
-                ds = pydicom.dcmread(fpath, stop_before_pixels=True, force=True)
-                series_uid = str(ds.SeriesInstanceUID)
-                series[series_uid].append(fpath)
-            except Exception:
-                # skip non-DICOM or missing SeriesUID
-                continue
-
-    # sort each list
+    folders: List[List[str]] = []
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        files: List[str] = []
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(
+                        follow_symlinks=False
+                    ) and _dicom_candidate(entry.name):
+                        files.append(entry.path)
+        except OSError:
+            continue
+        if files:
+            files.sort()
+            folders.append(files)
+
+    series: Dict[str, List[Tuple[int, Path]]] = defaultdict(list)
+    if folders:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for triples in ex.map(_gather_folder, folders, chunksize=4):
+                for uid, inst, fp in triples:
+                    series[uid].append((inst, Path(fp)))
+
+    # sort each list by the cached/derived instance order
+    out: Dict[str, List[Path]] = {}
     for uid, flist in series.items():
-        series[uid] = sort_slices_by_instance(flist)
-    return series
+        flist.sort(key=lambda t: t[0])
+        out[uid] = [p for _, p in flist]
+    return out